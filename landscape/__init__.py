@@ -1,3 +1,9 @@
+# This module is imported by the build and packaging tools (see setup.py and
+# Makefile.packaging) before any dependency is available, and by every
+# landscape-* command at startup: keep it free of imports.
+__all__ = ["DEBIAN_REVISION", "UPSTREAM_VERSION", "VERSION",
+           "DEFAULT_SERVER_API", "SERVER_API", "CLIENT_API"]
+
 DEBIAN_REVISION = ""
 UPSTREAM_VERSION = "18.01"
 VERSION = "%s%s" % (UPSTREAM_VERSION, DEBIAN_REVISION)
@@ -262,6 +262,19 @@ class BrokerClient(object):
         return gather_results([
             maybeDeferred(lambda x: x, result) for result in results])
 
+    @remote
+    def fire_events(self, events):
+        """Fire several events, in the given order.
+
+        @param events: A list of C{(event_type, args, kwargs)} tuples, each
+            of them fired as with L{fire_event}.
+        @return: A L{Deferred} resulting in a list holding, for each event,
+            the list of returns values of its handlers.
+        """
+        return gather_results([
+            self.fire_event(event_type, *args, **kwargs)
+            for event_type, args, kwargs in events])
+
     def handle_reconnect(self):
         """Called when the connection with the broker is established again.
 
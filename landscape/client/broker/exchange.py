@@ -402,6 +402,7 @@ class MessageExchange(object):
         self._exchanging = False
         self._urgent_exchange = False
         self._client_accepted_types = set()
+        self._sorted_client_accepted_types = None
         self._client_accepted_types_hash = None
         self._message_handlers = {}
         self._exchange_store = exchange_store
@@ -825,7 +826,7 @@ class MessageExchange(object):
         order they were registered.
         """
         self._message_handlers.setdefault(type, []).append(handler)
-        self._client_accepted_types.add(type)
+        self._add_client_accepted_type(type)
 
     def handle_message(self, message):
         """
@@ -849,10 +850,20 @@ class MessageExchange(object):
 
     def register_client_accepted_message_type(self, type):
         # stringify the type for sanity and less confusing logs.
-        self._client_accepted_types.add(str(type))
+        self._add_client_accepted_type(str(type))
 
     def get_client_accepted_message_types(self):
-        return sorted(self._client_accepted_types)
+        # The sorted list is needed at every exchange, while new types are
+        # only registered at startup, so keep it around until it changes.
+        if self._sorted_client_accepted_types is None:
+            self._sorted_client_accepted_types = sorted(
+                self._client_accepted_types)
+        return self._sorted_client_accepted_types
+
+    def _add_client_accepted_type(self, type):
+        if type not in self._client_accepted_types:
+            self._client_accepted_types.add(type)
+            self._sorted_client_accepted_types = None
 
 
 def get_accepted_types_diff(old_types, new_types):
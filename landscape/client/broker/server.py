@@ -43,9 +43,12 @@ Diagram::
 
 """
 
+import itertools
 import logging
+from operator import itemgetter
 
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, DeferredList
+from twisted.python.failure import Failure
 
 from landscape.lib.twisted_util import gather_results
 from landscape.client.amp import remote
@@ -95,14 +98,28 @@ class BrokerServer(object):
         self._registered_clients = {}
         self._connectors = {}
         self._pinger = pinger
+        self._queued_messages = []
+        self._flush_call = None
+        self._accepted_types = None
+        self._session_ids = {}
+        self._session_ids_generation = None
+        self._buffered_events = []
+        self._flush_events_call = None
 
         reactor.call_on("message", self.broadcast_message)
-        reactor.call_on("impending-exchange", self.impending_exchange)
+        reactor.call_on("impending-exchange",
+                        self._get_event_buffer("impending-exchange"))
         reactor.call_on("message-type-acceptance-changed",
-                        self.message_type_acceptance_changed)
-        reactor.call_on("server-uuid-changed", self.server_uuid_changed)
-        reactor.call_on("package-data-changed", self.package_data_changed)
-        reactor.call_on("resynchronize-clients", self.resynchronize)
+                        self._get_event_buffer(
+                            "message-type-acceptance-changed"))
+        reactor.call_on("message-type-acceptance-changed",
+                        self._reset_accepted_types)
+        reactor.call_on("server-uuid-changed",
+                        self._get_event_buffer("server-uuid-changed"))
+        reactor.call_on("package-data-changed",
+                        self._get_event_buffer("package-data-changed"))
+        reactor.call_on("resynchronize-clients",
+                        self._get_event_buffer("resynchronize"))
 
     @remote
     def ping(self):
@@ -132,8 +149,18 @@ class BrokerServer(object):
         (e.g. a message with the result of a "change-packages" activity
         delivered before re-registering). See also #328005 and #1158822.
 
+        Session IDs are cached per scope until the L{MessageStore} drops
+        them, since this method is called by every plugin.
         """
-        return self._message_store.get_session_id(scope=scope)
+        generation = self._message_store.get_session_ids_generation()
+        if generation != self._session_ids_generation:
+            self._session_ids = {}
+            self._session_ids_generation = generation
+        session_id = self._session_ids.get(scope)
+        if session_id is None:
+            session_id = self._message_store.get_session_id(scope=scope)
+            self._session_ids[scope] = session_id
+        return session_id
 
     @remote
     def register_client(self, name):
@@ -207,11 +234,78 @@ class BrokerServer(object):
             urgent = True
             session_id = self.get_session_id()
 
+        message_ids = self.send_messages([message], session_id, urgent=urgent)
+        if message_ids:
+            return message_ids[0]
+
+    @remote
+    def send_messages(self, messages, session_id, urgent=False):
+        """Queue several C{messages} for delivery to the server at once.
+
+        This is equivalent to calling L{send_message} for each message, but
+        the session ID is validated only once for the whole batch.
+
+        @param messages: A C{list} of message C{dict}s, see L{send_message}.
+        @param session_id: A session ID, see L{send_message}.
+        @param urgent: If C{True}, exchange urgently, otherwise exchange
+            during the next regularly scheduled exchange.
+        @return: The C{list} of message identifiers created when queuing the
+            C{messages}, or C{None} if the session ID is not valid.
+        """
+        if session_id is None:
+            raise RuntimeError(
+                "Session ID must be set before attempting to send a message")
+        if not self._message_store.is_valid_session_id(session_id):
+            return None
+        return [self._exchanger.send(message, urgent=urgent)
+                for message in messages]
+
+    @remote
+    def queue_message(self, message, session_id, urgent=False):
+        """Queue C{message} for delivery without waiting for it to be stored.
+
+        Messages queued during the same reactor iteration are stored
+        together, in the order they were queued, so callers sending many
+        messages don't pay the cost of storing each of them before being
+        able to send the next one.
+
+        @param message: The message C{dict}, see L{send_message}.
+        @param session_id: A session ID, see L{send_message}.
+        @param urgent: If C{True}, exchange urgently, otherwise exchange
+            during the next regularly scheduled exchange.
+        @return: A C{Deferred} firing with the message identifier once the
+            message has been stored, or with C{None} if it was discarded.
+        """
         if session_id is None:
             raise RuntimeError(
                 "Session ID must be set before attempting to send a message")
-        if self._message_store.is_valid_session_id(session_id):
-            return self._exchanger.send(message, urgent=urgent)
+        deferred = Deferred()
+        self._queued_messages.append((message, session_id, urgent, deferred))
+        if self._flush_call is None:
+            self._flush_call = self._reactor.call_later(
+                0, self._flush_queued_messages)
+        return deferred
+
+    def _flush_queued_messages(self):
+        """Store all messages queued with L{queue_message}."""
+        self._flush_call = None
+        queued = self._queued_messages
+        self._queued_messages = []
+        for session_id, entries in itertools.groupby(queued, itemgetter(1)):
+            # Validate the session once per run of messages sharing it, but
+            # store each message on its own so a message failing to be
+            # stored only fails its own deferred.
+            valid = self._message_store.is_valid_session_id(session_id)
+            for message, _, urgent, deferred in entries:
+                if not valid:
+                    deferred.callback(None)
+                    continue
+                try:
+                    message_id = self._exchanger.send(message, urgent=urgent)
+                except Exception:
+                    deferred.errback(Failure())
+                else:
+                    deferred.callback(message_id)
 
     @remote
     def is_message_pending(self, message_id):
@@ -220,13 +314,21 @@ class BrokerServer(object):
 
     @remote
     def stop_clients(self):
-        """Tell all the clients to exit."""
-        results = []
+        """Tell all the clients to exit.
+
+        The returned C{Deferred} fires only after all the clients are done
+        exiting, and fails with the first error if any of them failed.
+        """
         # FIXME: check whether the client are still alive
-        for client in self.get_clients():
-            results.append(client.exit())
-        result = gather_results(results, consume_errors=True)
-        return result.addCallback(lambda ignored: None)
+        results = [client.exit() for client in self.get_clients()]
+        result = DeferredList(results, consumeErrors=True)
+        return result.addCallback(self._check_exit_results)
+
+    def _check_exit_results(self, results):
+        """Return the first failure in C{results}, if any."""
+        for success, result in results:
+            if not success:
+                return result
 
     @remote
     def reload_configuration(self):
@@ -246,8 +348,19 @@ class BrokerServer(object):
 
     @remote
     def get_accepted_message_types(self):
-        """Return the message types accepted by the Landscape server."""
-        return self._message_store.get_accepted_types()
+        """Return the message types accepted by the Landscape server.
+
+        The types are cached until a C{message-type-acceptance-changed}
+        event is fired, since they are queried much more often than they
+        change.
+        """
+        if self._accepted_types is None:
+            self._accepted_types = self._message_store.get_accepted_types()
+        return self._accepted_types
+
+    def _reset_accepted_types(self, type, accepted):
+        """Drop the cached message types accepted by the Landscape server."""
+        self._accepted_types = None
 
     @remote
     def get_server_uuid(self):
@@ -293,14 +406,6 @@ class BrokerServer(object):
 
         return clients_stopped.addBoth(schedule_reactor_stop)
 
-    @event
-    def resynchronize(self):
-        """Broadcast a C{resynchronize} event to the clients."""
-
-    @event
-    def impending_exchange(self):
-        """Broadcast an C{impending-exchange} event to the clients."""
-
     @remote
     def listen_events(self, event_types):
         """
@@ -328,23 +433,44 @@ class BrokerServer(object):
     def broker_reconnect(self):
         """Broadcast a C{broker-reconnect} event to the clients."""
 
-    @event
-    def server_uuid_changed(self, old_uuid, new_uuid):
-        """Broadcast a C{server-uuid-changed} event to the clients."""
+    def _get_event_buffer(self, event_type):
+        """
+        Return a reactor handler buffering a C{event_type} event for the
+        clients, see L{_flush_events}.
+        """
 
-    @event
-    def message_type_acceptance_changed(self, type, accepted):
-        pass
+        def buffer_event(*args, **kwargs):
+            self._buffered_events.append((event_type, args, kwargs))
+            if self._flush_events_call is None:
+                self._flush_events_call = self._reactor.call_later(
+                    0, self._flush_events)
 
-    @event
-    def package_data_changed(self):
-        """Fire a package-data-changed event in the reactor of each client."""
+        return buffer_event
+
+    def _flush_events(self):
+        """Broadcast all buffered events with a single call per client.
+
+        @return: A L{Deferred} firing once all clients have been notified.
+        """
+        if self._flush_events_call is not None:
+            self._reactor.cancel_call(self._flush_events_call)
+            self._flush_events_call = None
+        events = self._buffered_events
+        self._buffered_events = []
+        fired = []
+        if events:
+            for client in self.get_clients():
+                fired.append(client.fire_events(events))
+        return gather_results(fired)
 
     def broadcast_message(self, message):
         """Call the C{message} method of all the registered plugins.
 
         @see: L{register_plugin}.
         """
+        # Deliver any pending event first, so clients see events and
+        # messages in the order they happened.
+        self._flush_events()
         results = []
         for client in self.get_clients():
             results.append(client.message(message))
@@ -140,6 +140,7 @@ class MessageStore(object):
         self._schemas = {}
         self._original_persist = persist
         self._persist = persist.root_at("message-store")
+        self._session_ids_generation = 0
         message_dir = self._message_dir()
         if not os.path.isdir(message_dir):
             os.makedirs(message_dir)
@@ -533,8 +534,17 @@ class MessageStore(object):
         """
         return session_id in self._persist.get("session-ids", {})
 
+    def get_session_ids_generation(self):
+        """Return a number that changes every time session ids are dropped.
+
+        Callers caching session ids can compare it with the value they got
+        when caching them, to know whether the cached ids are still valid.
+        """
+        return self._session_ids_generation
+
     def drop_session_ids(self, scopes=None):
         """Drop all session ids."""
+        self._session_ids_generation += 1
         new_session_ids = {}
         if scopes:
             session_ids = self._persist.get("session-ids", {})
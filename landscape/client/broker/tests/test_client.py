@@ -398,6 +398,20 @@ class BrokerClientTest(LandscapeTest):
         self.client.fire_event(event_type, "test", False)
         callback.assert_called_once_with(False)
 
+    def test_fire_events(self):
+        """
+        The L{BrokerClient.fire_events} method fires the given events in
+        order and results in the list of their handlers' return values.
+        """
+        calls = []
+        self.client_reactor.call_on("event1", lambda: calls.append(1) or 1)
+        self.client_reactor.call_on(
+            "event2", lambda value: calls.append(value) or value)
+        result = self.client.fire_events(
+            [("event1", (), {}), ("event2", (), {"value": 2})])
+        self.assertEqual([1, 2], calls)
+        self.assertEqual([[1], [2]], self.successResultOf(result))
+
     def test_handle_reconnect(self):
         """
         The L{BrokerClient.handle_reconnect} method is triggered by a
@@ -1113,6 +1113,18 @@ class AcceptedTypesMessageExchangeTest(LandscapeTest):
                          sorted(["type-A", "type-B", "type-C"] +
                                 DEFAULT_ACCEPTED_TYPES))
 
+    def test_register_accepted_message_type_after_get(self):
+        """
+        Message types registered after the accepted types have been fetched
+        are included the next time they are fetched.
+        """
+        self.exchanger.register_client_accepted_message_type("type-B")
+        self.exchanger.get_client_accepted_message_types()
+        self.exchanger.register_client_accepted_message_type("type-A")
+        types = self.exchanger.get_client_accepted_message_types()
+        self.assertEqual(types,
+                         sorted(["type-A", "type-B"] + DEFAULT_ACCEPTED_TYPES))
+
     def test_exchange_sends_message_type_when_no_hash(self):
         self.exchanger.register_client_accepted_message_type("type-A")
         self.exchanger.register_client_accepted_message_type("type-B")
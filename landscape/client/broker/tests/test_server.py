@@ -2,8 +2,9 @@ import random
 
 from configobj import ConfigObj
 from mock import Mock
-from twisted.internet.defer import succeed, fail
+from twisted.internet.defer import succeed, fail, Deferred, DeferredList
 
+from landscape.lib.twisted_util import gather_results
 from landscape.client.manager.manager import FAILED
 from landscape.client.tests.helpers import (
         LandscapeTest, DEFAULT_ACCEPTED_TYPES)
@@ -29,6 +30,13 @@ class BrokerServerTest(LandscapeTest):
 
     helpers = [BrokerServerHelper]
 
+    def _register_two(self):
+        """Register two fake clients named C{foo} and C{bar}."""
+        self.broker.connectors_registry = {"foo": FakeCreator,
+                                           "bar": FakeCreator}
+        return gather_results([self.broker.register_client("foo"),
+                               self.broker.register_client("bar")])
+
     def test_ping(self):
         """
         The L{BrokerServer.ping} simply returns C{True}.
@@ -59,6 +67,31 @@ class BrokerServerTest(LandscapeTest):
         self.assertEqual(disk_session_id1, disk_session_id2)
         self.assertNotEqual(disk_session_id1, users_session_id)
 
+    def test_get_session_id_is_cached(self):
+        """
+        The L{BrokerServer.get_session_id} method doesn't ask the
+        L{MessageStore} for a session ID it already handed out, until
+        session IDs are dropped.
+        """
+        session_id = self.broker.get_session_id()
+        self.mstore.get_session_id = Mock()
+        self.assertEqual(session_id, self.broker.get_session_id())
+        self.mstore.get_session_id.assert_not_called()
+
+    def test_get_session_id_after_dropping_scope(self):
+        """
+        The L{BrokerServer.get_session_id} method returns a new session ID
+        for a scope whose session IDs were dropped, but keeps the one of
+        the other scopes.
+        """
+        disk_session_id1 = self.broker.get_session_id(scope="disk")
+        users_session_id1 = self.broker.get_session_id(scope="users")
+        self.mstore.drop_session_ids(scopes=["disk"])
+        disk_session_id2 = self.broker.get_session_id(scope="disk")
+        users_session_id2 = self.broker.get_session_id(scope="users")
+        self.assertNotEqual(disk_session_id1, disk_session_id2)
+        self.assertEqual(users_session_id1, users_session_id2)
+
     def test_send_message(self):
 
         """
@@ -107,6 +140,172 @@ class BrokerServerTest(LandscapeTest):
         self.assertRaises(
             RuntimeError, self.broker.send_message, message, None)
 
+    def test_send_messages(self):
+        """
+        The L{BrokerServer.send_messages} method forwards several messages to
+        the broker's exchanger and returns their identifiers.
+        """
+        messages = [{"type": "test", "data": 1}, {"type": "test", "data": 2}]
+        self.mstore.set_accepted_types(["test"])
+        session_id = self.broker.get_session_id()
+        message_ids = self.broker.send_messages(messages, session_id)
+        self.assertEqual(2, len(message_ids))
+        self.assertMessages(self.mstore.get_pending_messages(), messages)
+        self.assertFalse(self.exchanger.is_urgent())
+
+    def test_send_messages_with_urgent(self):
+        """
+        The L{BrokerServer.send_messages} can optionally specify the urgency
+        of the messages.
+        """
+        messages = [{"type": "test", "data": 1}, {"type": "test", "data": 2}]
+        self.mstore.set_accepted_types(["test"])
+        session_id = self.broker.get_session_id()
+        self.broker.send_messages(messages, session_id, urgent=True)
+        self.assertMessages(self.mstore.get_pending_messages(), messages)
+        self.assertTrue(self.exchanger.is_urgent())
+
+    def test_send_messages_with_urgent_and_obsolete_messages(self):
+        """
+        No urgent exchange is scheduled if all the messages passed to
+        L{BrokerServer.send_messages} are discarded as obsolete.
+        """
+        self.exchange_store.add_message_context(
+            123, "old-secure-id", "test")
+        self.identity.secure_id = "new-secure-id"
+        self.mstore.set_accepted_types(["test"])
+        session_id = self.broker.get_session_id()
+        message_ids = self.broker.send_messages(
+            [{"type": "test", "operation-id": 123}], session_id, urgent=True)
+        self.assertEqual([None], message_ids)
+        self.assertMessages(self.mstore.get_pending_messages(), [])
+        self.assertFalse(self.exchanger.is_urgent())
+
+    def test_send_message_with_urgent_and_blackhole(self):
+        """
+        An urgent exchange is still scheduled when the message store drops
+        messages while waiting for a resync after a week of failures.
+        """
+        self.mstore.set_accepted_types(["test"])
+        self.mstore.record_failure(0)
+        self.mstore.record_failure((7 * 24 * 60 * 60) + 1)
+        session_id = self.broker.get_session_id()
+        message_id = self.broker.send_message(
+            {"type": "test"}, session_id, urgent=True)
+        self.assertIs(None, message_id)
+        self.assertTrue(self.exchanger.is_urgent())
+
+    def test_send_messages_with_urgent_and_error(self):
+        """
+        If a message passed to L{BrokerServer.send_messages} fails to be
+        stored, the messages stored before it still get an urgent exchange.
+        """
+        self.mstore.set_accepted_types(["test"])
+        session_id = self.broker.get_session_id()
+        messages = [{"type": "test"}, {"type": "no-such-type"}]
+        self.assertRaises(
+            KeyError, self.broker.send_messages, messages, session_id,
+            urgent=True)
+        self.assertMessages(self.mstore.get_pending_messages(),
+                            [{"type": "test"}])
+        self.assertTrue(self.exchanger.is_urgent())
+
+    def test_send_messages_wont_send_with_invalid_session_id(self):
+        """
+        The L{BrokerServer.send_messages} call will silently drop all the
+        messages if the session id is invalid.
+        """
+        messages = [{"type": "test", "data": 1}, {"type": "test", "data": 2}]
+        self.mstore.set_accepted_types(["test"])
+        self.assertIs(None, self.broker.send_messages(messages, "Not Valid"))
+        self.assertMessages(self.mstore.get_pending_messages(), [])
+
+    def test_send_messages_with_none_as_session_id_raises(self):
+        """
+        Like L{BrokerServer.send_message}, C{send_messages} raises an error if
+        called without a session id.
+        """
+        self.mstore.set_accepted_types(["test"])
+        self.assertRaises(
+            RuntimeError, self.broker.send_messages, [{"type": "test"}], None)
+
+    def test_queue_message(self):
+        """
+        The L{BrokerServer.queue_message} method returns a deferred without
+        storing the message right away. Messages queued in the same reactor
+        iteration are stored together, after which their deferreds fire with
+        the message identifiers.
+        """
+        messages = [{"type": "test", "data": 1}, {"type": "test", "data": 2}]
+        self.mstore.set_accepted_types(["test"])
+        session_id = self.broker.get_session_id()
+        deferreds = [self.broker.queue_message(message, session_id)
+                     for message in messages]
+        result = DeferredList(deferreds)
+        self.assertFalse(result.called)
+        self.assertMessages(self.mstore.get_pending_messages(), [])
+        self.reactor.advance(0)
+        self.assertMessages(self.mstore.get_pending_messages(), messages)
+        self.assertFalse(self.exchanger.is_urgent())
+        [(success1, message_id1), (success2, message_id2)] = (
+            self.successResultOf(result))
+        self.assertTrue(success1 and success2)
+        self.assertTrue(self.broker.is_message_pending(message_id1))
+        self.assertTrue(self.broker.is_message_pending(message_id2))
+
+    def test_queue_message_with_urgent(self):
+        """
+        The L{BrokerServer.queue_message} can optionally specify the urgency
+        of the message.
+        """
+        message = {"type": "test"}
+        self.mstore.set_accepted_types(["test"])
+        session_id = self.broker.get_session_id()
+        self.broker.queue_message({"type": "test"}, session_id)
+        self.broker.queue_message(message, session_id, urgent=True)
+        self.reactor.advance(0)
+        self.assertTrue(self.exchanger.is_urgent())
+
+    def test_queue_message_with_invalid_message(self):
+        """
+        If a queued message fails to be stored, only its own deferred fails,
+        while the deferreds of the other messages flushed along with it fire
+        with their message identifiers.
+        """
+        self.mstore.set_accepted_types(["test"])
+        session_id = self.broker.get_session_id()
+        deferred1 = self.broker.queue_message({"type": "test"}, session_id)
+        deferred2 = self.broker.queue_message(
+            {"type": "no-such-type"}, session_id)
+        deferred3 = self.broker.queue_message({"type": "test"}, session_id)
+        self.reactor.advance(0)
+        self.assertMessages(self.mstore.get_pending_messages(),
+                            [{"type": "test"}, {"type": "test"}])
+        self.assertTrue(
+            self.broker.is_message_pending(self.successResultOf(deferred1)))
+        self.failureResultOf(deferred2).trap(KeyError)
+        self.assertTrue(
+            self.broker.is_message_pending(self.successResultOf(deferred3)))
+
+    def test_queue_message_wont_send_with_invalid_session_id(self):
+        """
+        Messages queued with an invalid session id are silently dropped, and
+        the returned deferred fires with C{None}.
+        """
+        self.mstore.set_accepted_types(["test"])
+        deferred = self.broker.queue_message({"type": "test"}, "Not Valid")
+        self.reactor.advance(0)
+        self.assertIs(None, self.successResultOf(deferred))
+        self.assertMessages(self.mstore.get_pending_messages(), [])
+
+    def test_queue_message_with_none_as_session_id_raises(self):
+        """
+        Like L{BrokerServer.send_message}, C{queue_message} raises an error if
+        called without a session id.
+        """
+        self.assertRaises(
+            RuntimeError, self.broker.queue_message, {"type": "test"}, None)
+
     def test_send_message_with_old_release_upgrader(self):
         """
         If we receive a message from an old release-upgrader process that
@@ -171,10 +370,7 @@ class BrokerServerTest(LandscapeTest):
         of each registered client, and returns a deferred resulting in C{None}
         if all C{exit} calls were successful.
         """
-        self.broker.connectors_registry = {"foo": FakeCreator,
-                                           "bar": FakeCreator}
-        self.broker.register_client("foo")
-        self.broker.register_client("bar")
+        self._register_two()
         for client in self.broker.get_clients():
             client.exit = Mock(return_value=succeed(None))
         return self.assertSuccess(self.broker.stop_clients())
@@ -184,15 +380,27 @@ class BrokerServerTest(LandscapeTest):
         The L{BrokerServer.stop_clients} method calls the C{exit} method of
         each registered client, and raises an exception if any calls fail.
         """
-        self.broker.connectors_registry = {"foo": FakeCreator,
-                                           "bar": FakeCreator}
-        self.broker.register_client("foo")
-        self.broker.register_client("bar")
+        self._register_two()
         [client1, client2] = self.broker.get_clients()
         client1.exit = Mock(return_value=succeed(None))
         client2.exit = Mock(return_value=fail(Exception()))
         return self.assertFailure(self.broker.stop_clients(), Exception)
 
+    def test_stop_clients_waits_for_all_clients(self):
+        """
+        The L{BrokerServer.stop_clients} method fails only after all the
+        clients are done exiting, even if one of them fails early.
+        """
+        self._register_two()
+        [client1, client2] = self.broker.get_clients()
+        exited = Deferred()
+        client1.exit = Mock(return_value=exited)
+        client2.exit = Mock(return_value=fail(ZeroDivisionError()))
+        result = self.broker.stop_clients()
+        self.assertFalse(result.called)
+        exited.callback(None)
+        self.failureResultOf(result).trap(ZeroDivisionError)
+
     def test_reload_configuration(self):
         """
         The L{BrokerServer.reload_configuration} method forces the config
@@ -211,10 +419,7 @@ class BrokerServerTest(LandscapeTest):
         The L{BrokerServer.reload_configuration} method forces the config
         file associated with the broker server to be reloaded.
         """
-        self.broker.connectors_registry = {"foo": FakeCreator,
-                                           "bar": FakeCreator}
-        self.broker.register_client("foo")
-        self.broker.register_client("bar")
+        self._register_two()
         for client in self.broker.get_clients():
             client.exit = Mock(return_value=succeed(None))
         return self.assertSuccess(self.broker.reload_configuration())
@@ -244,7 +449,19 @@ class BrokerServerTest(LandscapeTest):
         message types accepted by the Landscape server.
         """
         self.mstore.set_accepted_types(["foo", "bar"])
-        self.assertEqual(sorted(self.broker.get_accepted_message_types()),
+        self.assertCountEqual(self.broker.get_accepted_message_types(),
+                              ["foo", "bar"])
+
+    def test_get_accepted_message_types_after_change(self):
+        """
+        The L{BrokerServer.get_accepted_message_types} method returns the new
+        accepted message types after the server changed them.
+        """
+        self.mstore.set_accepted_types(["foo"])
+        self.assertEqual(self.broker.get_accepted_message_types(), ["foo"])
+        self.exchanger.handle_message(
+            {"type": "accepted-types", "types": ["foo", "bar"]})
+        self.assertEqual(self.broker.get_accepted_message_types(),
                          ["bar", "foo"])
 
     def test_get_server_uuid_with_unset_uuid(self):
@@ -285,10 +502,7 @@ class BrokerServerTest(LandscapeTest):
         """
         The L{BrokerServer.exit} method stops all registered clients.
         """
-        self.broker.connectors_registry = {"foo": FakeCreator,
-                                           "bar": FakeCreator}
-        self.broker.register_client("foo")
-        self.broker.register_client("bar")
+        self._register_two()
         for client in self.broker.get_clients():
             client.exit = Mock(return_value=succeed(None))
         return self.assertSuccess(self.broker.exit())
@@ -406,18 +620,24 @@ class EventTest(LandscapeTest):
 
     def test_resynchronize(self):
         """
-        The L{BrokerServer.resynchronize} method broadcasts a C{resynchronize}
-        event to all connected clients.
+        A C{resynchronize-clients} event fired by the broker reactor is
+        broadcast as a C{resynchronize} event to all connected clients.
         """
         callback = Mock(return_value="foo")
         self.client_reactor.call_on("resynchronize", callback)
-        return self.assertSuccess(self.broker.resynchronize(["foo"]),
-                                  [["foo"]])
+        self.reactor.fire("resynchronize-clients", scopes=["foo"])
+
+        def assert_called(ignored):
+            callback.assert_called_once_with(scopes=["foo"])
+
+        deferred = self.assertSuccess(self.broker._flush_events(),
+                                      [[["foo"]]])
+        return deferred.addCallback(assert_called)
 
     def test_impending_exchange(self):
         """
-        The L{BrokerServer.impending_exchange} method broadcasts an
-        C{impending-exchange} event to all connected clients.
+        An C{impending-exchange} event fired by the broker reactor is
+        broadcast to all connected clients.
         """
         plugin = Mock()
         plugin.register = Mock()
@@ -428,8 +648,8 @@ class EventTest(LandscapeTest):
             plugin.register.assert_called_once_with(self.client)
             plugin.exchange.assert_called_once_with()
 
-        deferred = self.assertSuccess(
-            self.broker.impending_exchange(), [[None]])
+        self.reactor.fire("impending-exchange")
+        deferred = self.assertSuccess(self.broker._flush_events(), [[[None]]])
         deferred.addCallback(assert_called)
         return deferred
 
@@ -458,8 +678,8 @@ class EventTest(LandscapeTest):
 
     def test_server_uuid_changed(self):
         """
-        The L{BrokerServer.server_uuid_changed} method broadcasts a
-        C{server-uuid-changed} event to all connected clients.
+        A C{server-uuid-changed} event fired by the broker reactor is
+        broadcast to all connected clients.
         """
         return_value = random.randint(1, 100)
         callback = Mock(return_value=return_value)
@@ -468,32 +688,35 @@ class EventTest(LandscapeTest):
             callback.assert_called_once_with(None, "abc")
 
         self.client_reactor.call_on("server-uuid-changed", callback)
+        self.reactor.fire("server-uuid-changed", None, "abc")
         deferred = self.assertSuccess(
-            self.broker.server_uuid_changed(None, "abc"), [[return_value]])
+            self.broker._flush_events(), [[[return_value]]])
         return deferred.addCallback(assert_called)
 
     def test_message_type_acceptance_changed(self):
         """
-        The L{BrokerServer.message_type_acceptance_changed} method broadcasts
-        a C{message-type-acceptance-changed} event to all connected clients.
+        A C{message-type-acceptance-changed} event fired by the broker
+        reactor is broadcast to all connected clients.
         """
         return_value = random.randint(1, 100)
         callback = Mock(return_value=return_value)
         self.client_reactor.call_on(
             ("message-type-acceptance-changed", "type"), callback)
-        result = self.broker.message_type_acceptance_changed("type", True)
-        return self.assertSuccess(result, [[return_value]])
+        self.reactor.fire("message-type-acceptance-changed", "type", True)
+        return self.assertSuccess(
+            self.broker._flush_events(), [[[return_value]]])
 
     def test_package_data_changed(self):
         """
-        The L{BrokerServer.package_data_changed} method broadcasts a
-        C{package-data-changed} event to all connected clients.
+        A C{package-data-changed} event fired by the broker reactor is
+        broadcast to all connected clients.
         """
         return_value = random.randint(1, 100)
         callback = Mock(return_value=return_value)
         self.client_reactor.call_on("package-data-changed", callback)
+        self.reactor.fire("package-data-changed")
         return self.assertSuccess(
-            self.broker.package_data_changed(), [[return_value]])
+            self.broker._flush_events(), [[[return_value]]])
 
 
 class HandlersTest(LandscapeTest):
@@ -546,49 +769,51 @@ class HandlersTest(LandscapeTest):
         result.addCallback(broadcasted)
         return result
 
-    def test_impending_exchange(self):
+    def test_event_broadcast(self):
         """
-        When an C{impending-exchange} event is fired by the reactor, the
-        broker broadcasts it to its clients.
-        """
-        self.client.fire_event = Mock(return_value=succeed(None))
-        self.reactor.fire("impending-exchange")
-        self.client.fire_event.assert_called_once_with("impending-exchange")
-
-    def test_message_type_acceptance_changed(self):
-        """
-        When a C{message-type-acceptance-changed} event is fired by the
+        When one of the events the broker is interested in is fired by the
         reactor, the broker broadcasts it to its clients.
         """
-        self.client.fire_event = Mock(return_value=succeed(None))
-        self.reactor.fire("message-type-acceptance-changed", "test", True)
-        self.client.fire_event.assert_called_once_with(
-            "message-type-acceptance-changed", "test", True)
-
-    def test_server_uuid_changed(self):
-        """
-        When a C{server-uuid-changed} event is fired by the reactor, the
-        broker broadcasts it to its clients.
-        """
-        self.client.fire_event = Mock(return_value=succeed(None))
-        self.reactor.fire("server-uuid-changed", None, 123)
-        self.client.fire_event.assert_called_once_with(
-            "server-uuid-changed", None, 123)
-
-    def test_package_data_changed(self):
-        """
-        When a C{package-data-changed} event is fired by the reactor, the
-        broker broadcasts it to its clients.
-        """
-        self.client.fire_event = Mock(return_value=succeed(None))
+        events = [
+            ("impending-exchange", (), "impending-exchange"),
+            ("message-type-acceptance-changed", ("test", True),
+             "message-type-acceptance-changed"),
+            ("server-uuid-changed", (None, 123), "server-uuid-changed"),
+            ("package-data-changed", (), "package-data-changed"),
+            ("resynchronize-clients", (), "resynchronize")]
+        for event_type, args, broadcast_type in events:
+            self.client.fire_events = Mock(return_value=succeed(None))
+            self.reactor.fire(event_type, *args)
+            self.reactor.advance(0)
+            self.client.fire_events.assert_called_once_with(
+                [(broadcast_type, args, {})])
+
+    def test_event_broadcast_coalesced(self):
+        """
+        Events fired by the reactor within the same iteration are broadcast
+        to each client with a single call.
+        """
+        self.client.fire_events = Mock(return_value=succeed(None))
+        self.reactor.fire("impending-exchange")
         self.reactor.fire("package-data-changed")
-        self.client.fire_event.assert_called_once_with("package-data-changed")
-
-    def test_resynchronize_clients(self):
-        """
-        When a C{resynchronize} event is fired by the reactor, the
-        broker broadcasts it to its clients.
-        """
-        self.client.fire_event = Mock(return_value=succeed(None))
+        self.client.fire_events.assert_not_called()
+        self.reactor.advance(0)
+        self.client.fire_events.assert_called_once_with(
+            [("impending-exchange", (), {}),
+             ("package-data-changed", (), {})])
+
+    def test_event_broadcast_before_message(self):
+        """
+        Buffered events are broadcast before a message received later, so
+        clients see them in the original order.
+        """
+        calls = []
+        self.client.fire_events = Mock(
+            side_effect=lambda events: calls.append("events") or succeed(None))
+        self.client.message = Mock(
+            side_effect=lambda message: calls.append("message") or succeed(
+                True))
         self.reactor.fire("resynchronize-clients")
-        self.client.fire_event.assert_called_once_with("resynchronize")
+        self.reactor.fire("message", {"type": "test"})
+        self.reactor.advance(0)
+        self.assertEqual(["events", "message"], calls)
@@ -553,6 +553,18 @@ class MessageStoreTest(LandscapeTest):
         self.store.drop_session_ids()
         self.assertFalse(self.store.is_valid_session_id(session_id))
 
+    def test_drop_session_ids_changes_generation(self):
+        """
+        Dropping session ids changes the value returned by
+        C{get_session_ids_generation}.
+        """
+        generation = self.store.get_session_ids_generation()
+        self.store.get_session_id()
+        self.assertEqual(generation, self.store.get_session_ids_generation())
+        self.store.drop_session_ids()
+        self.assertNotEqual(
+            generation, self.store.get_session_ids_generation())
+
     def test_drop_session_ids_drops_all_scopes_with_no_scopes_parameter(self):
         """When C{drop_session_ids} is called with no scopes then all
         session_ids are dropped.
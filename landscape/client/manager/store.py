@@ -24,20 +24,18 @@ class ManagerStore(object):
         cursor.execute("SELECT graph_id, filename, user FROM graph")
         return cursor.fetchall()
 
+    def add_graph(self, graph_id, filename, user):
+        self.add_graphs([(graph_id, filename, user)])
+
     @with_cursor
-    def add_graph(self, cursor, graph_id, filename, user):
-        cursor.execute(
-            "SELECT graph_id FROM graph WHERE graph_id=?",
-            (graph_id,))
-        if cursor.fetchone():
-            cursor.execute(
-                "UPDATE graph SET filename=?, user=? WHERE graph_id=?",
-                (filename, user, graph_id))
-        else:
-            cursor.execute(
-                "INSERT INTO graph (graph_id, filename, user) "
-                "VALUES (?, ?, ?)",
-                (graph_id, filename, user))
+    def add_graphs(self, cursor, graphs):
+        """Add or update several graphs in a single transaction.
+
+        @param graphs: A sequence of C{(graph_id, filename, user)} tuples.
+        """
+        cursor.executemany(
+            "INSERT OR REPLACE INTO graph (graph_id, filename, user) "
+            "VALUES (?, ?, ?)", graphs)
 
     @with_cursor
     def remove_graph(self, cursor, graph_id):
@@ -7,8 +7,7 @@ class ManagerStoreTest(LandscapeTest):
 
     def setUp(self):
         super(ManagerStoreTest, self).setUp()
-        self.filename = self.makeFile()
-        self.store = ManagerStore(self.filename)
+        self.store = ManagerStore(":memory:")
         self.store.add_graph(1, u"file 1", u"user1")
         self.store.set_graph_accumulate(1, 1234, 1.0)
 
@@ -39,6 +38,13 @@ class ManagerStoreTest(LandscapeTest):
         graph = self.store.get_graph(1)
         self.assertEqual(graph, (1, u"file 2", u"user2"))
 
+    def test_add_graphs(self):
+        self.store.add_graphs([(1, u"file 2", u"user2"),
+                               (3, u"file 3", u"user3")])
+        graphs = self.store.get_graphs()
+        self.assertEqual(graphs, [(1, u"file 2", u"user2"),
+                                  (3, u"file 3", u"user3")])
+
     def test_remove_graph(self):
         self.store.remove_graph(1)
         graphs = self.store.get_graphs()
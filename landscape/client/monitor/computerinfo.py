@@ -1,6 +1,8 @@
+import errno
 import os
 import logging
 from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.python.compat import _PY3
 
 from landscape.lib.fetch import fetch_async
 from landscape.lib.fs import read_text_file
@@ -10,12 +12,25 @@ from landscape.lib.network import get_fqdn
 from landscape.client.monitor.plugin import MonitorPlugin
 
 METADATA_RETRY_MAX = 3  # Number of retries to get EC2 meta-data
+FQDN_TTL = 300  # Seconds before looking up the FQDN again
 
 
 class DistributionInfoError(Exception):
     pass
 
 
+def _get_meminfo_value(data, key):
+    """Return the value of C{key} in the C{/proc/meminfo} content C{data}.
+
+    @raises KeyError: If C{key} is not found in C{data}.
+    """
+    start = data.find(key)
+    if start == -1:
+        raise KeyError(key)
+    start += len(key)
+    return int(data[start:data.find(b"\n", start)].split()[0])
+
+
 class ComputerInfo(MonitorPlugin):
     """Plugin captures and reports basic computer information."""
 
@@ -33,6 +48,10 @@ class ComputerInfo(MonitorPlugin):
         self._cloud_instance_metadata = None
         self._cloud_retries = 0
         self._fetch_async = fetch_async
+        self._distribution_info_key = None
+        self._distribution_info = None
+        self._fqdn = None
+        self._fqdn_time = None
 
     def register(self, registry):
         super(ComputerInfo, self).register(registry)
@@ -76,70 +95,113 @@ class ComputerInfo(MonitorPlugin):
                                 self.send_computer_message, urgent)
         broker.call_if_accepted("distribution-info",
                                 self.send_distribution_message, urgent)
-        broker.call_if_accepted("cloud-instance-metadata",
-                                self.send_cloud_instance_metadata_message,
-                                urgent)
+        if self._should_fetch_cloud_instance_metadata():
+            broker.call_if_accepted("cloud-instance-metadata",
+                                    self.send_cloud_instance_metadata_message,
+                                    urgent)
 
     def _create_computer_info_message(self):
         message = {}
-        self._add_if_new(message, "hostname", self._get_fqdn())
+        self._add_if_new(message, "hostname", self._get_cached_fqdn())
         total_memory, total_swap = self._get_memory_info()
         self._add_if_new(message, "total-memory", total_memory)
         self._add_if_new(message, "total-swap", total_swap)
-        annotations = {}
-        if os.path.exists(self._annotations_path):
-            for key in os.listdir(self._annotations_path):
-                annotations[key] = read_text_file(
-                    os.path.join(self._annotations_path, key))
-
+        annotations = self._get_annotations()
         if annotations:
             self._add_if_new(message, "annotations", annotations)
         return message
 
+    def _get_cached_fqdn(self):
+        """Return the FQDN, looking it up again every L{FQDN_TTL} seconds.
+
+        Resolving the FQDN may block on DNS, so avoid doing it on every
+        exchange.
+        """
+        now = self.registry.reactor.time()
+        if self._fqdn_time is None or now - self._fqdn_time >= FQDN_TTL:
+            self._fqdn = self._get_fqdn()
+            self._fqdn_time = now
+        return self._fqdn
+
+    def _get_annotations(self):
+        """Return a C{dict} mapping annotation names to their content.
+
+        Only regular files in the annotations directory are considered.
+        """
+        annotations = {}
+        try:
+            if _PY3:
+                # scandir gets the file type and path along with the name,
+                # without an extra stat call per entry.
+                with os.scandir(self._annotations_path) as scan:
+                    entries = [(entry.name, entry.path)
+                               for entry in scan if entry.is_file()]
+            else:
+                entries = []
+                for key in os.listdir(self._annotations_path):
+                    path = os.path.join(self._annotations_path, key)
+                    if os.path.isfile(path):
+                        entries.append((key, path))
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+            return annotations
+        for key, path in entries:
+            annotations[key] = read_text_file(path)
+        return annotations
+
     def _add_if_new(self, message, key, value):
         if value != self._persist.get(key):
             self._persist.set(key, value)
             message[key] = value
 
     def _create_distribution_info_message(self):
-        message = self._get_distribution_info()
-        if message != self._persist.get("distribution-info"):
-            self._persist.set("distribution-info", message)
-            return message
+        """Return the distribution details if they changed, or C{None}.
+
+        The release file is only parsed again if its path, modification
+        time or size changed since the last call.
+        """
+        stat = os.stat(self._lsb_release_filename)
+        key = (self._lsb_release_filename, stat.st_mtime, stat.st_size)
+        if key != self._distribution_info_key:
+            self._distribution_info = parse_lsb_release(
+                self._lsb_release_filename)
+            self._distribution_info_key = key
+        if self._distribution_info != self._persist.get("distribution-info"):
+            self._persist.set("distribution-info", self._distribution_info)
+            return dict(self._distribution_info)
         return None
 
     def _get_memory_info(self):
         """Get details in megabytes and return a C{(memory, swap)} tuple."""
-        message = {}
-        file = open(self._meminfo_filename)
-        for line in file:
-            if line != '\n':
-                parts = line.split(":")
-                key = parts[0]
-                if key in ["MemTotal", "SwapTotal"]:
-                    value = int(parts[1].strip().split(" ")[0])
-                    message[key] = value
-        file.close()
-        return (message["MemTotal"] // 1024, message["SwapTotal"] // 1024)
-
-    def _get_distribution_info(self):
-        """Get details about the distribution."""
-        message = {}
-        message.update(parse_lsb_release(self._lsb_release_filename))
-        return message
+        # Read the file with a single call, so both values come from the
+        # same snapshot of the kernel's memory information.
+        fd = os.open(self._meminfo_filename, os.O_RDONLY)
+        try:
+            data = os.read(fd, 8192)
+        finally:
+            os.close(fd)
+        memory = _get_meminfo_value(data, b"MemTotal:")
+        swap = _get_meminfo_value(data, b"SwapTotal:")
+        return (memory // 1024, swap // 1024)
 
     @inlineCallbacks
     def _create_cloud_instance_metadata_message(self):
         """Fetch cloud metadata and insert it in a message."""
         message = None
-        if (self._cloud_instance_metadata is None and
-            self._cloud_retries < METADATA_RETRY_MAX
-            ):
-
+        if self._should_fetch_cloud_instance_metadata():
             self._cloud_instance_metadata = yield self._fetch_ec2_meta_data()
             message = self._cloud_instance_metadata
         returnValue(message)
 
+    def _should_fetch_cloud_instance_metadata(self):
+        """
+        Return C{True} if the cloud metadata wasn't fetched yet and retries
+        are left.
+        """
+        return (self._cloud_instance_metadata is None and
+                self._cloud_retries < METADATA_RETRY_MAX)
+
     def _fetch_ec2_meta_data(self):
         """Fetch information about the cloud instance."""
         if self._cloud_retries == 0:
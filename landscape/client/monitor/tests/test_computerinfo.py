@@ -7,7 +7,7 @@ from twisted.internet.defer import succeed, fail, inlineCallbacks
 from landscape.lib.fetch import HTTPCodeError, PyCurlError
 from landscape.lib.fs import create_text_file
 from landscape.client.monitor.computerinfo import (
-        ComputerInfo, METADATA_RETRY_MAX)
+        ComputerInfo, FQDN_TTL, METADATA_RETRY_MAX)
 from landscape.client.tests.helpers import LandscapeTest, MonitorHelper
 
 SAMPLE_LSB_RELEASE = "DISTRIB_ID=Ubuntu\n"                         \
@@ -127,11 +127,29 @@ VmallocChunk:   107432 kB
         self.assertEqual(len(messages), 1)
         self.assertEqual(messages[0]["hostname"], "ooga")
 
+        self.reactor.advance(FQDN_TTL)
         plugin.exchange()
         messages = self.mstore.get_pending_messages()
         self.assertEqual(len(messages), 2)
         self.assertEqual(messages[1]["hostname"], "wubble")
 
+    def test_fqdn_cached(self):
+        """
+        The FQDN is only looked up again once L{FQDN_TTL} seconds have
+        passed since the last lookup.
+        """
+        get_fqdn = mock.Mock(return_value="ooga")
+        plugin = ComputerInfo(get_fqdn=get_fqdn, fetch_async=self.fetch_func)
+        self.monitor.add(plugin)
+        self.assertEqual("ooga", plugin._get_cached_fqdn())
+        self.reactor.advance(FQDN_TTL - 1)
+        self.assertEqual("ooga", plugin._get_cached_fqdn())
+        self.assertEqual(1, get_fqdn.call_count)
+        get_fqdn.return_value = "wubble"
+        self.reactor.advance(1)
+        self.assertEqual("wubble", plugin._get_cached_fqdn())
+        self.assertEqual(2, get_fqdn.call_count)
+
     def test_get_total_memory(self):
         self.mstore.set_accepted_types(["computer-info"])
         meminfo_filename = self.makeFile(self.sample_memory_info)
@@ -274,6 +292,24 @@ DISTRIB_DESCRIPTION="Ubuntu 6.10"
         self.assertEqual(message["release"], "6.10")
         self.assertEqual(message["code-name"], "edgy")
 
+    def test_distribution_info_parsed_once(self):
+        """
+        The release file is not parsed again if it didn't change since the
+        last exchange.
+        """
+        self.mstore.set_accepted_types(["distribution-info"])
+        plugin = ComputerInfo(lsb_release_filename=self.lsb_release_filename)
+        self.monitor.add(plugin)
+        with mock.patch("landscape.client.monitor.computerinfo."
+                        "parse_lsb_release") as parse_lsb_release:
+            parse_lsb_release.return_value = {"release": "6.06"}
+            plugin.exchange()
+            plugin.exchange()
+        parse_lsb_release.assert_called_once_with(self.lsb_release_filename)
+        messages = self.mstore.get_pending_messages()
+        self.assertEqual(1, len(messages))
+        self.assertEqual("6.06", messages[0]["release"])
+
     def test_unknown_distribution_key(self):
         self.mstore.set_accepted_types(["distribution-info"])
         lsb_release_filename = self.makeFile("""\
@@ -387,6 +423,24 @@ DISTRIB_NEW_UNEXPECTED_KEY=ooga
         self.assertEqual("value1", meta_data["annotation1"])
         self.assertEqual("value2", meta_data["annotation2"])
 
+    def test_annotations_skips_directories(self):
+        """
+        Entries of the annotations.d directory which aren't regular files
+        are ignored.
+        """
+        annotations_dir = self.monitor.config.annotations_path
+        os.mkdir(annotations_dir)
+        create_text_file(
+            os.path.join(annotations_dir, "annotation1"), "value1")
+        os.mkdir(os.path.join(annotations_dir, "subdir"))
+        self.mstore.set_accepted_types(["computer-info"])
+
+        plugin = ComputerInfo()
+        self.monitor.add(plugin)
+        plugin.exchange()
+        messages = self.mstore.get_pending_messages()
+        self.assertEqual({"annotation1": "value1"}, messages[0]["annotations"])
+
     def test_fetch_cloud_metadata(self):
         """
         Fetch cloud information and insert it in a cloud-instance-metadata
@@ -432,6 +486,20 @@ DISTRIB_NEW_UNEXPECTED_KEY=ooga
         messages = self.mstore.get_pending_messages()
         self.assertEqual(0, len(messages))
 
+    def test_no_cloud_instance_metadata_call_when_fetched(self):
+        """
+        Once the cloud metadata has been fetched, exchanges don't go
+        through the C{cloud-instance-metadata} message creation anymore.
+        """
+        self.mstore.set_accepted_types(["cloud-instance-metadata"])
+        plugin = ComputerInfo(fetch_async=self.fetch_func)
+        plugin._cloud_instance_metadata = {"instance-id": u"i00001"}
+        self.monitor.add(plugin)
+        with mock.patch.object(
+                plugin, "send_cloud_instance_metadata_message") as send:
+            plugin.exchange()
+        send.assert_not_called()
+
     @inlineCallbacks
     def test_fetch_ec2_meta_data(self):
         """
@@ -31,22 +31,28 @@ class ProcessInformation(object):
 
     def get_all_process_info(self):
         """Get process information for all processes on the system."""
+        # Read the uptime once for the whole sweep, rather than once for
+        # every process.
+        uptime = self._uptime or sysstats.get_uptime()
         for filename in os.listdir(self._proc_dir):
             try:
                 process_id = int(filename)
             except ValueError:
                 continue
-            process_info = self.get_process_info(process_id)
+            process_info = self.get_process_info(process_id, uptime=uptime)
             if process_info:
                 yield process_info
 
-    def get_process_info(self, process_id):
+    def get_process_info(self, process_id, uptime=None):
         """
         Parse the /proc/<pid>/cmdline and /proc/<pid>/status files for
         information about the running process with process_id.
 
         The /proc filesystem doesn't behave like ext2, open files can disappear
         during the read process.
+
+        @param uptime: The system uptime to calculate the CPU usage with. If
+            C{None}, it will be read from /proc/uptime.
         """
         cmd_line_name = ""
         process_dir = os.path.join(self._proc_dir, str(process_id))
@@ -106,7 +112,8 @@ class ProcessInformation(object):
                 start_time = int(parts[21])
                 utime = int(parts[13])
                 stime = int(parts[14])
-                uptime = self._uptime or sysstats.get_uptime()
+                if uptime is None:
+                    uptime = self._uptime or sysstats.get_uptime()
                 pcpu = calculate_pcpu(utime, stime, uptime,
                                       start_time, self._jiffies_per_sec)
                 process_info["percent-cpu"] = pcpu
@@ -17,19 +17,25 @@ class CommandError(Exception):
 class MemoryStats(object):
 
     def __init__(self, filename="/proc/meminfo"):
+        keys = [b"MemTotal", b"SwapFree", b"SwapTotal", b"MemFree",
+                b"Buffers", b"Cached"]
         data = {}
-        for line in open(filename):
-            if ":" in line:
-                key, value = line.split(":", 1)
-                if key in ["MemTotal", "SwapFree", "SwapTotal", "MemFree",
-                           "Buffers", "Cached"]:
-                    data[key] = int(value.split()[0])
-
-        self.total_memory = data["MemTotal"] // 1024
-        self.free_memory = (data["MemFree"] + data["Buffers"] +
-                            data["Cached"]) // 1024
-        self.total_swap = data["SwapTotal"] // 1024
-        self.free_swap = data["SwapFree"] // 1024
+        # The content is plain ASCII, read it as bytes to skip decoding.
+        with open(filename, "rb") as fd:
+            for line in fd:
+                if b":" in line:
+                    key, value = line.split(b":", 1)
+                    if key in keys:
+                        data[key] = int(value.split()[0])
+                        if len(data) == len(keys):
+                            # All the keys we need come early in the file.
+                            break
+
+        self.total_memory = data[b"MemTotal"] // 1024
+        self.free_memory = (data[b"MemFree"] + data[b"Buffers"] +
+                            data[b"Cached"]) // 1024
+        self.total_swap = data[b"SwapTotal"] // 1024
+        self.free_swap = data[b"SwapFree"] // 1024
 
     @property
     def used_memory(self):
@@ -80,11 +86,16 @@ def get_uptime(uptime_file=u"/proc/uptime"):
     """
     This parses a file in /proc/uptime format and returns a floating point
     version of the first value (the actual uptime).
+
+    @param uptime_file: The path of the file to parse, or a binary file
+        object to read the data from.
     """
-    with open(uptime_file, 'r') as ufile:
-        data = ufile.readline()
-    up, idle = data.split()
-    return float(up)
+    if hasattr(uptime_file, "readline"):
+        data = uptime_file.readline()
+    else:
+        with open(uptime_file, 'rb') as ufile:
+            data = ufile.readline()
+    return float(data.split(None, 1)[0])
 
 
 def get_thermal_zones(thermal_zone_path=None):
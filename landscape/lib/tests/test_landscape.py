@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import landscape
+
+
+class LandscapeModuleTest(unittest.TestCase):
+
+    def test_import_has_no_side_effects(self):
+        """
+        Importing the top-level C{landscape} package doesn't pull in the
+        Twisted reactor, since it's imported by the build tools and at the
+        start of every command. This is checked in a separate process, as
+        the test runner already imported Twisted.
+        """
+        root = os.path.dirname(os.path.dirname(
+            os.path.abspath(landscape.__file__)))
+        code = ("import sys, landscape; "
+                "sys.exit('twisted.internet.reactor' in sys.modules)")
+        self.assertEqual(
+            0, subprocess.call([sys.executable, "-c", code], cwd=root))
@@ -88,6 +88,20 @@ class ProcessInfoTest(testing.FSTestCase, unittest.TestCase):
         self.assertTrue(fakefile1.closed)
         self.assertTrue(fakefile2.closed)
 
+    @mock.patch("landscape.lib.sysstats.get_uptime", return_value=100.0)
+    def test_get_all_process_info_reads_uptime_once(self, get_uptime_mock):
+        """
+        C{get_all_process_info} reads the system uptime only once, and uses
+        it for all the processes.
+        """
+        self._add_process_info(12)
+        self._add_process_info(13)
+        process_info = ProcessInformation(self.proc_dir, jiffies=1,
+                                          boot_time=0)
+        processes = list(process_info.get_all_process_info())
+        self.assertEqual(2, len(processes))
+        get_uptime_mock.assert_called_once_with()
+
     def test_get_process_info_state(self):
         """
         C{get_process_info} reads the process state from the status file
@@ -1,4 +1,5 @@
 from datetime import datetime
+import io
 import os
 import re
 import unittest
@@ -129,6 +130,12 @@ class UptimeTest(BaseTestCase):
     """Test for parsing /proc/uptime data."""
 
     def test_valid_uptime_file(self):
+        """Test ensures that we can read valid /proc/uptime data."""
+        proc_file = io.BytesIO(b"17608.24 16179.25")
+        self.assertEqual("%0.2f" % get_uptime(proc_file),
+                         "17608.24")
+
+    def test_valid_uptime_path(self):
         """Test ensures that we can read a valid /proc/uptime file."""
         proc_file = self.makeFile("17608.24 16179.25")
         self.assertEqual("%0.2f" % get_uptime(proc_file),